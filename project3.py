@@ -3,10 +3,42 @@ import sys
 import os
 import struct
 import csv
+import bisect
+import mmap
+from array import array
 from collections import OrderedDict
 
 BLOCK_SIZE = 512
 MAGIC = b"4348PRJ3"  # 8 bytes
+CACHE_NODES = 3          # nodes kept in memory by single-operation commands
+LOAD_CACHE_NODES = 64    # wider cache for bulk loads from CSV
+PRINT_CHUNK_LINES = 4096  # print writes its output this many lines at a time
+
+# File format (every number is an 8-byte big-endian unsigned int):
+#   block 0   header: MAGIC, root block id (0 = empty), next free block id
+#   block 1+  node:   block id, parent id, key count, 19 keys, 19 values,
+#                     20 child ids (0 = none), zero padding to BLOCK_SIZE
+# The byte order is fixed by the project spec, so node fields are kept in
+# native array('Q') buffers and swapped once per block on little-endian hosts.
+_BYTESWAP = sys.byteorder == "little"
+
+
+def _iov_max():
+    try:
+        n = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        n = -1
+    return n if n > 0 else 1024
+
+
+_IOV_MAX = _iov_max()    # most buffers a single pwritev may take
+
+
+def _u64_array(seq):
+    """Return seq as an array of unsigned 64-bit ints (no copy if it is one)."""
+    if isinstance(seq, array):
+        return seq
+    return array('Q', seq or ())
 
 
 # -------------------------
@@ -18,12 +50,17 @@ class BTreeNode:
     MAX_KEYS = 2 * T - 1         # 19
     MAX_CHILDREN = 2 * T         # 20
 
-    def __init__(self, block_id, parent_id, keys=None, values=None, children=None):
+    def __init__(self, block_id, parent_id, keys=None, values=None, children=None,
+                 leaf=None):
         self.block_id = block_id
         self.parent_id = parent_id
-        self.keys = keys or []
-        self.values = values or []
-        self.children = children or []
+        self.keys = _u64_array(keys)
+        self.values = _u64_array(values)
+        self.children = _u64_array(children)
+        if leaf is None:
+            # Leaf if there are no non-zero children
+            leaf = not any(self.children)
+        self._leaf = leaf
         self.dirty = True        # needs to be written back
 
     @property
@@ -31,8 +68,7 @@ class BTreeNode:
         return len(self.keys)
 
     def is_leaf(self):
-        # Leaf if there are no non-zero children
-        return not any(self.children)
+        return self._leaf
 
     def encode(self):
         """Serialize node into a 512-byte block."""
@@ -43,30 +79,20 @@ class BTreeNode:
         if len(self.children) > self.MAX_CHILDREN:
             raise ValueError("too many children")
 
-        # pad arrays
-        keys = self.keys + [0] * (self.MAX_KEYS - len(self.keys))
-        values = self.values + [0] * (self.MAX_KEYS - len(self.values))
-        children = self.children + [0] * (self.MAX_CHILDREN - len(self.children))
+        pad_keys = _PADDING[self.MAX_KEYS - len(self.keys)]
 
-        buf = bytearray(BLOCK_SIZE)
-        buf[0:8] = struct.pack(">Q", self.block_id)
-        buf[8:16] = struct.pack(">Q", self.parent_id)
-        buf[16:24] = struct.pack(">Q", self.count)
-
-        offset = 24
-        # keys
-        for k in keys:
-            buf[offset:offset + 8] = struct.pack(">Q", k)
-            offset += 8
-        # values
-        for v in values:
-            buf[offset:offset + 8] = struct.pack(">Q", v)
-            offset += 8
-        # children
-        for c in children:
-            buf[offset:offset + 8] = struct.pack(">Q", c)
-            offset += 8
+        fields = array('Q', (self.block_id, self.parent_id, self.count))
+        fields += self.keys
+        fields += pad_keys
+        fields += self.values
+        fields += pad_keys
+        fields += self.children
+        fields += _PADDING[self.MAX_CHILDREN - len(self.children)]
+        if _BYTESWAP:
+            fields.byteswap()
 
+        buf = bytearray(BLOCK_SIZE)
+        buf[0:_NODE_BYTES] = fields
         return bytes(buf)
 
     @classmethod
@@ -74,81 +100,201 @@ class BTreeNode:
         """Deserialize node from a 512-byte block."""
         if len(data) != BLOCK_SIZE:
             raise ValueError("bad block size")
-        b_id = struct.unpack(">Q", data[0:8])[0]
-        parent_id = struct.unpack(">Q", data[8:16])[0]
-        count = struct.unpack(">Q", data[16:24])[0]
-
-        keys = []
-        values = []
-        children = []
-
-        offset = 24
-        for _ in range(cls.MAX_KEYS):
-            keys.append(struct.unpack(">Q", data[offset:offset + 8])[0])
-            offset += 8
-        for _ in range(cls.MAX_KEYS):
-            values.append(struct.unpack(">Q", data[offset:offset + 8])[0])
-            offset += 8
-        for _ in range(cls.MAX_CHILDREN):
-            children.append(struct.unpack(">Q", data[offset:offset + 8])[0])
-            offset += 8
-
-        node = cls(b_id, parent_id, keys[:count], values[:count], children[:count + 1])
+        # read the whole block (padding included) straight from data, and
+        # index the header, so the only copies made are the three fields
+        fields = array('Q')
+        fields.frombytes(data)
+        if _BYTESWAP:
+            fields.byteswap()
+        b_id = fields[0]
+        parent_id = fields[1]
+        count = fields[2]
+
+        keys = fields[_KEYS_AT:_KEYS_AT + count]
+        values = fields[_VALUES_AT:_VALUES_AT + count]
+        children = fields[_CHILDREN_AT:_CHILDREN_AT + count + 1]
+
+        node = cls(b_id, parent_id, keys, values, children)
         node.dirty = False
         return node
 
 
+# Node block: header (block id, parent id, count) + keys + values + children.
+# The shape is fixed, so field offsets (in 8-byte words) and the zero padding
+# for every possible fill level are computed once here.
+_KEYS_AT = 3
+_VALUES_AT = _KEYS_AT + BTreeNode.MAX_KEYS
+_CHILDREN_AT = _VALUES_AT + BTreeNode.MAX_KEYS
+_NODE_BYTES = 8 * (_CHILDREN_AT + BTreeNode.MAX_CHILDREN)
+_ZEROS = array('Q', bytes(8 * BTreeNode.MAX_CHILDREN))
+_PADDING = [_ZEROS[:n] for n in range(BTreeNode.MAX_CHILDREN + 1)]
+
+
 # -------------------------
 # Node cache (max 3 nodes in memory)
 # -------------------------
 
 class NodeCache:
-    def __init__(self, f, max_nodes=3):
+    """Segmented LRU of at most max_nodes nodes.
+
+    Freshly loaded or newly allocated blocks enter the probation segment and
+    are promoted to the protected segment when touched again, so the root and
+    interior nodes that every descent revisits are not pushed out by a run of
+    leaves. Pinned nodes are never evicted; only while a split has pinned
+    nodes can the cache briefly hold more than max_nodes.
+    """
+
+    def __init__(self, f, max_nodes=3, mm=None):
         self.f = f
+        self._fd = f.fileno()    # blocks use positional pread/pwrite
+        self._mm = mm            # read-only mapping of the file, if any
         self.max_nodes = max_nodes
-        self.cache = OrderedDict()   # block_id -> node
+        self.protected_max = max(1, max_nodes - max(1, max_nodes // 4))
+        self.probation = OrderedDict()   # block_id -> node, seen once
+        self.protected = OrderedDict()   # block_id -> node, seen again
+        self.pinned = {}                 # block_id -> pin count, not evictable
 
     def _read_block(self, block_id):
-        self.f.seek(block_id * BLOCK_SIZE)
-        data = self.f.read(BLOCK_SIZE)
+        offset = block_id * BLOCK_SIZE
+        if self._mm is not None:
+            data = self._mm[offset:offset + BLOCK_SIZE]
+        else:
+            data = os.pread(self._fd, BLOCK_SIZE, offset)
         if len(data) != BLOCK_SIZE:
             raise IOError(f"Failed to read block {block_id}")
         return data
 
     def _write_block(self, block_id, data):
-        if len(data) != BLOCK_SIZE:
+        self._write_blocks(block_id, [data])
+
+    def _write_blocks(self, block_id, blocks):
+        """Write consecutive blocks starting at block_id, one pwritev per
+        _IOV_MAX blocks."""
+        if any(len(data) != BLOCK_SIZE for data in blocks):
             raise ValueError("bad block size for write")
-        self.f.seek(block_id * BLOCK_SIZE)
-        self.f.write(data)
+        for start in range(0, len(blocks), _IOV_MAX):
+            chunk = blocks[start:start + _IOV_MAX]
+            offset = (block_id + start) * BLOCK_SIZE
+            written = os.pwritev(self._fd, chunk, offset)
+            if written < len(chunk) * BLOCK_SIZE:
+                # short write: finish the rest of this chunk with pwrite
+                rest = memoryview(b"".join(chunk))[written:]
+                offset += written
+                while rest:
+                    written = os.pwrite(self._fd, rest, offset)
+                    if written == 0:
+                        raise IOError(f"Failed to write block {block_id + start}")
+                    rest = rest[written:]
+                    offset += written
+
+    def prefetch(self, first_block, end_block):
+        """Hint the OS to start reading blocks [first_block, end_block) with a
+        single madvise/fadvise call."""
+        start = first_block * BLOCK_SIZE
+        length = (end_block - first_block) * BLOCK_SIZE
+        if length <= 0:
+            return
+        if self._mm is not None:
+            if hasattr(mmap, "MADV_WILLNEED"):
+                # start is block-aligned; madvise needs it page-aligned
+                aligned = start - start % mmap.PAGESIZE
+                self._mm.madvise(mmap.MADV_WILLNEED, aligned,
+                                 length + start - aligned)
+        elif hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self._fd, start, length, os.POSIX_FADV_WILLNEED)
+
+    def _write_node(self, node):
+        self._write_block(node.block_id, node.encode())
+        # only once the block is on disk; a failed write leaves it dirty
+        node.dirty = False
+
+    def _evict(self):
+        """Evict LRU nodes (probation first) until there is room for one more."""
+        while len(self.probation) + len(self.protected) >= self.max_nodes:
+            for segment in (self.probation, self.protected):
+                old_block_id = next(
+                    (bid for bid in segment if bid not in self.pinned), None)
+                if old_block_id is not None:
+                    break
+            else:
+                return   # everything resident is pinned
+            old_node = segment[old_block_id]
+            if old_node.dirty:
+                self._write_node(old_node)
+            del segment[old_block_id]
+
+    def pin(self, block_id):
+        self.pinned[block_id] = self.pinned.get(block_id, 0) + 1
+
+    def unpin(self, block_id):
+        if self.pinned[block_id] == 1:
+            del self.pinned[block_id]
+        else:
+            self.pinned[block_id] -= 1
+
+    def _promote(self, block_id, node):
+        self.protected[block_id] = node
+        if len(self.protected) > self.protected_max:
+            # demote protected LRU back to probation
+            old_block_id, old_node = self.protected.popitem(last=False)
+            self.probation[old_block_id] = old_node
 
     def get(self, block_id):
         """Get node from cache or load from disk."""
-        node = self.cache.get(block_id)
+        node = self.protected.get(block_id)
         if node is not None:
-            self.cache.move_to_end(block_id)
+            self.protected.move_to_end(block_id)
             return node
 
-        # possibly evict LRU
-        if len(self.cache) >= self.max_nodes:
-            old_block_id, old_node = self.cache.popitem(last=False)
-            if old_node.dirty:
-                self._write_block(old_block_id, old_node.encode())
+        node = self.probation.pop(block_id, None)
+        if node is not None:
+            self._promote(block_id, node)
+            return node
 
+        self._evict()
         data = self._read_block(block_id)
         node = BTreeNode.decode(block_id, data)
-        self.cache[block_id] = node
+        self.probation[block_id] = node
         return node
 
     def mark_dirty(self, node):
         node.dirty = True
-        self.cache[node.block_id] = node
-        self.cache.move_to_end(node.block_id)
+        bid = node.block_id
+        if bid in self.protected:
+            segment = self.protected
+        elif bid in self.probation:
+            segment = self.probation
+        else:
+            # a new (or previously evicted) block takes a slot like a load
+            self._evict()
+            segment = self.probation
+        segment[bid] = node
+        segment.move_to_end(bid)
+
+    def _write_run(self, block_id, nodes):
+        self._write_blocks(block_id, [node.encode() for node in nodes])
+        for node in nodes:
+            node.dirty = False
 
     def flush_all(self):
-        for bid, node in self.cache.items():
-            if node.dirty:
-                self._write_block(bid, node.encode())
-        self.cache.clear()
+        dirty = [node for segment in (self.probation, self.protected)
+                 for node in segment.values() if node.dirty]
+        dirty.sort(key=lambda node: node.block_id)
+
+        # one write per run of consecutive block ids
+        run_start, run = 0, []
+        for node in dirty:
+            if run and node.block_id != run_start + len(run):
+                self._write_run(run_start, run)
+                run = []
+            if not run:
+                run_start = node.block_id
+            run.append(node)
+        if run:
+            self._write_run(run_start, run)
+
+        self.probation.clear()
+        self.protected.clear()
 
 
 # -------------------------
@@ -156,8 +302,10 @@ class NodeCache:
 # -------------------------
 
 class BTreeFile:
-    def __init__(self, path, mode='r+b', create=False):
+    def __init__(self, path, mode='r+b', create=False, cache_size=None):
         self.path = path
+        self.readonly = not create and mode == 'rb'
+        self.mm = None
 
         if create:
             if os.path.exists(path):
@@ -176,13 +324,16 @@ class BTreeFile:
             header = self.f.read(BLOCK_SIZE)
             if len(header) != BLOCK_SIZE or header[0:8] != MAGIC:
                 raise ValueError("Invalid index file")
+            if self.readonly:
+                # read-only commands serve blocks straight from the page cache
+                self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
 
-        self._load_header()
-        self.cache = NodeCache(self.f, max_nodes=3)
+        self._load_header(header)
+        if cache_size is None:
+            cache_size = CACHE_NODES
+        self.cache = NodeCache(self.f, max_nodes=cache_size, mm=self.mm)
 
-    def _load_header(self):
-        self.f.seek(0)
-        header = self.f.read(BLOCK_SIZE)
+    def _load_header(self, header):
         self.root_id = struct.unpack(">Q", header[8:16])[0]
         self.next_block_id = struct.unpack(">Q", header[16:24])[0]
 
@@ -195,16 +346,33 @@ class BTreeFile:
         self.f.write(header)
         self.f.flush()
 
-    def close(self):
+    def flush(self, fsync=False):
+        """Write all dirty nodes and the header; optionally fsync the file."""
         self.cache.flush_all()
         self._write_header()
-        self.f.close()
+        if fsync:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        try:
+            if self.readonly:
+                self.mm.close()
+            else:
+                self.flush()
+        finally:
+            self.f.close()
+
+    def _check_writable(self):
+        if self.readonly:
+            raise RuntimeError("Index file opened read-only")
 
     def allocate_node(self, parent_id):
+        self._check_writable()
         block_id = self.next_block_id
         self.next_block_id += 1
         # start as a leaf: one dummy child 0
-        node = BTreeNode(block_id, parent_id, [], [], [0])
+        node = BTreeNode(block_id, parent_id, array('Q'), array('Q'), _ZEROS[:1],
+                         leaf=True)
         self.cache.mark_dirty(node)
         return node
 
@@ -219,51 +387,71 @@ class BTreeFile:
         return self._search_node(self.root_id, key)
 
     def _search_node(self, block_id, key):
-        node = self.get_node(block_id)
-        i = 0
-        while i < node.count and key > node.keys[i]:
-            i += 1
-        if i < node.count and key == node.keys[i]:
-            return node.values[i]
-        if node.is_leaf():
-            return None
-        child_id = node.children[i]
-        if child_id == 0:
-            return None
-        return self._search_node(child_id, key)
+        while True:
+            node = self.get_node(block_id)
+            i = bisect.bisect_left(node.keys, key)
+            if i < node.count and key == node.keys[i]:
+                return node.values[i]
+            if node.is_leaf():
+                return None
+            block_id = node.children[i]
+            if block_id == 0:
+                return None
 
     # ---- insert ----
 
     def insert(self, key, value):
+        self._check_writable()
         # ensure unsigned 64-bit range
         if not (0 <= key <= 2**64 - 1 and 0 <= value <= 2**64 - 1):
             raise ValueError("Key/value out of range")
 
         if self.root_id == 0:
             root = self.allocate_node(parent_id=0)
-            root.keys = [key]
-            root.values = [value]
-            root.children = [0, 0]
+            root.keys = array('Q', (key,))
+            root.values = array('Q', (value,))
+            root.children = array('Q', (0, 0))
             self.cache.mark_dirty(root)
             self.root_id = root.block_id
             return
 
         root = self.get_node(self.root_id)
         if root.count == BTreeNode.MAX_KEYS:
-            # split full root
-            new_root = self.allocate_node(parent_id=0)
-            new_root.children = [root.block_id]
-            root.parent_id = new_root.block_id
-            self.cache.mark_dirty(root)
-            self.root_id = new_root.block_id
-            self._split_child(new_root, 0, root)
+            # split full root; pin it so allocating the new root can't evict it
+            self.cache.pin(root.block_id)
+            try:
+                new_root = self.allocate_node(parent_id=0)
+                new_root.children = array('Q', (root.block_id,))
+                new_root._leaf = False
+                root.parent_id = new_root.block_id
+                self.cache.mark_dirty(root)
+                self.root_id = new_root.block_id
+                self._split_child(new_root, 0, root)
+            finally:
+                self.cache.unpin(root.block_id)
             self._insert_nonfull(new_root, key, value)
         else:
             self._insert_nonfull(root, key, value)
 
     def _split_child(self, parent, index, full_child):
+        # keep the three nodes being rewritten resident while the new node is
+        # allocated and the moved children are loaded, so none of them is
+        # written out twice
+        split_ids = [parent.block_id, full_child.block_id]
+        for bid in split_ids:
+            self.cache.pin(bid)
+        try:
+            new_node = self.allocate_node(parent_id=parent.block_id)
+            self.cache.pin(new_node.block_id)
+            split_ids.append(new_node.block_id)
+            new_node._leaf = full_child._leaf
+            self._move_upper_half(parent, index, full_child, new_node)
+        finally:
+            for bid in split_ids:
+                self.cache.unpin(bid)
+
+    def _move_upper_half(self, parent, index, full_child, new_node):
         t = BTreeNode.T
-        new_node = self.allocate_node(parent_id=parent.block_id)
 
         median_key = full_child.keys[t - 1]
         median_val = full_child.values[t - 1]
@@ -273,10 +461,9 @@ class BTreeFile:
         new_node.values = full_child.values[t:]
 
         if full_child.is_leaf():
-            new_node.children = [0] * (len(new_node.keys) + 1)
+            new_node.children = _ZEROS[:len(new_node.keys) + 1]
         else:
             new_node.children = full_child.children[t:]
-            full_child.children = full_child.children[:t]
             # update parent id for moved children
             for child_id in new_node.children:
                 if child_id != 0:
@@ -284,9 +471,10 @@ class BTreeFile:
                     child.parent_id = new_node.block_id
                     self.cache.mark_dirty(child)
 
-        # shrink full_child
-        full_child.keys = full_child.keys[:t - 1]
-        full_child.values = full_child.values[:t - 1]
+        # shrink full_child in place (drops the median and the moved half)
+        del full_child.keys[t - 1:]
+        del full_child.values[t - 1:]
+        del full_child.children[t:]
 
         # insert median into parent
         parent.keys.insert(index, median_key)
@@ -298,23 +486,23 @@ class BTreeFile:
         self.cache.mark_dirty(new_node)
 
     def _insert_nonfull(self, node, key, value):
-        # find first index where key <= node.keys[i]
-        i = 0
-        while i < node.count and key > node.keys[i]:
-            i += 1
-
-        # key already exists: update value
-        if i < node.count and key == node.keys[i]:
-            node.values[i] = value
-            self.cache.mark_dirty(node)
-            return
+        while True:
+            # find first index where key <= node.keys[i]
+            i = bisect.bisect_left(node.keys, key)
+
+            # key already exists: update value
+            if i < node.count and key == node.keys[i]:
+                node.values[i] = value
+                self.cache.mark_dirty(node)
+                return
+
+            if node.is_leaf():
+                # insert at position i
+                node.keys.insert(i, key)
+                node.values.insert(i, value)
+                self.cache.mark_dirty(node)
+                return
 
-        if node.is_leaf():
-            # insert at position i
-            node.keys.insert(i, key)
-            node.values.insert(i, value)
-            self.cache.mark_dirty(node)
-        else:
             child_id = node.children[i]
             child = self.get_node(child_id)
             if child.count == BTreeNode.MAX_KEYS:
@@ -328,27 +516,37 @@ class BTreeFile:
                     return
                 child_id = node.children[i]
                 child = self.get_node(child_id)
-            self._insert_nonfull(child, key, value)
+            node = child
 
     # ---- traversal ----
 
-    def inorder_traverse(self, out_func):
+    def items(self):
+        """Yield (key, value) pairs in key order."""
         if self.root_id == 0:
             return
-        self._inorder_node(self.root_id, out_func)
+        yield from self._iter_node(self.root_id)
 
-    def _inorder_node(self, block_id, out_func):
-        node = self.get_node(block_id)
-        for i in range(node.count):
-            if not node.is_leaf():
-                child_id = node.children[i]
-                if child_id != 0:
-                    self._inorder_node(child_id, out_func)
-            out_func(node.keys[i], node.values[i])
-        if not node.is_leaf():
-            last_child = node.children[node.count]
-            if last_child != 0:
-                self._inorder_node(last_child, out_func)
+    def inorder_traverse(self, out_func):
+        for k, v in self.items():
+            out_func(k, v)
+
+    def _iter_node(self, block_id):
+        # a full walk reads every node block, so read them all ahead at once
+        self.cache.prefetch(1, self.next_block_id)
+        # explicit stack of (node, i): yield key i-1, then descend into child i
+        stack = [(self.get_node(block_id), 0)]
+        while stack:
+            node, i = stack.pop()
+            if node.is_leaf():
+                yield from zip(node.keys, node.values)
+                continue
+            if i > 0:
+                yield node.keys[i - 1], node.values[i - 1]
+            if i < node.count:
+                stack.append((node, i + 1))
+            child_id = node.children[i]
+            if child_id != 0:
+                stack.append((self.get_node(child_id), 0))
 
 
 # -------------------------
@@ -374,7 +572,7 @@ def cmd_insert(idx_path, key_str, value_str):
 
 def cmd_search(idx_path, key_str):
     key = int(key_str)
-    bt = BTreeFile(idx_path)
+    bt = BTreeFile(idx_path, mode='rb')
     try:
         val = bt.search(key)
     finally:
@@ -385,8 +583,9 @@ def cmd_search(idx_path, key_str):
 
 
 def cmd_load(idx_path, csv_path):
-    bt = BTreeFile(idx_path)
+    bt = BTreeFile(idx_path, cache_size=LOAD_CACHE_NODES)
     try:
+        rows = []
         with open(csv_path, "r", newline="") as f:
             reader = csv.reader(f)
             for row in reader:
@@ -394,17 +593,32 @@ def cmd_load(idx_path, csv_path):
                     continue
                 if len(row) != 2:
                     raise RuntimeError("Bad CSV row")
-                key = int(row[0].strip())
-                value = int(row[1].strip())
-                bt.insert(key, value)
+                rows.append((int(row[0].strip()), int(row[1].strip())))
+        # sorted inserts keep hitting the same leaf; the sort is stable, so
+        # the last value for a duplicate key still wins. The cost is a
+        # sparser tree: every split leaves the left node at the minimum
+        # t-1 keys (see README, "Memory Rule Enforcement").
+        rows.sort(key=lambda r: r[0])
+        for key, value in rows:
+            bt.insert(key, value)
     finally:
         bt.close()
 
 
 def cmd_print(idx_path):
-    bt = BTreeFile(idx_path)
+    bt = BTreeFile(idx_path, mode='rb')
     try:
-        bt.inorder_traverse(lambda k, v: print(f"{k} {v}"))
+        # format straight to bytes and write in chunks, not one print per pair
+        out = sys.stdout.buffer
+        lines = []
+        sys.stdout.flush()
+        for k, v in bt.items():
+            lines.append(b"%d %d\n" % (k, v))
+            if len(lines) >= PRINT_CHUNK_LINES:
+                out.writelines(lines)
+                lines.clear()
+        out.writelines(lines)
+        out.flush()
     finally:
         bt.close()
 
@@ -412,11 +626,11 @@ def cmd_print(idx_path):
 def cmd_extract(idx_path, out_csv):
     if os.path.exists(out_csv):
         raise RuntimeError("Output file exists")
-    bt = BTreeFile(idx_path)
+    bt = BTreeFile(idx_path, mode='rb')
     try:
         with open(out_csv, "w", newline="") as f:
             writer = csv.writer(f)
-            bt.inorder_traverse(lambda k, v: writer.writerow([k, v]))
+            writer.writerows(bt.items())
     finally:
         bt.close()
 